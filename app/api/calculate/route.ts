@@ -1,6 +1,5 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { google } from 'googleapis'
-import { createJetLagTimetable } from '../../lib/jetlag'
+import { createJetLagTimetable, lruGet, timetableInputsKey } from '../../lib/jetlag'
 
 type Inputs = {
   originOffset: number
@@ -18,6 +17,19 @@ type Inputs = {
   adjustmentStart: 'after_arrival' | 'travel_start' | 'precondition' | 'precondition_with_travel' 
 }
 
+// Entries hold the serialized body so a cache hit skips JSON encoding as well
+type CachedTimetable = { json: string; eventsCount: number }
+
+const TIMETABLE_CACHE_SIZE = 256
+const timetableCache = new Map<string, CachedTimetable>()
+
+function cachedTimetable(inputs: Inputs): CachedTimetable {
+  return lruGet(timetableCache, timetableInputsKey(inputs), TIMETABLE_CACHE_SIZE, () => {
+    const events = createJetLagTimetable(inputs)
+    return { json: JSON.stringify({ events }), eventsCount: events.length }
+  })
+}
+
 export async function POST(req: NextRequest) {
   const body = (await req.json()) as Inputs
   try {
@@ -26,18 +38,18 @@ export async function POST(req: NextRequest) {
       console.log(`[calculate] input ${dbgIn.length} bytes`, dbgIn.slice(0, 1000))
     }
     const t0 = Date.now()
-    const events = createJetLagTimetable(body)
+    const { json, eventsCount } = cachedTimetable(body)
     const dt = Date.now() - t0
     // Log asynchronously after response so UI isn't delayed by Sheets write
     setTimeout(() => {
-      appendCalculationLog(req, body, { eventsCount: events?.length ?? 0, durationMs: dt }).catch((e) => {
+      appendCalculationLog(req, body, { eventsCount, durationMs: dt }).catch((e) => {
         if (process.env.CALC_DEBUG) console.warn('[calculate] log error', e)
       })
     }, 0)
     if (process.env.CALC_DEBUG) {
-      console.log(`[calculate] returned ${Array.isArray(events)?events.length:'n/a'} events in ${dt}ms`)
+      console.log(`[calculate] returned ${eventsCount} events in ${dt}ms`)
     }
-    return NextResponse.json({ events })
+    return new NextResponse(json, { headers: { 'Content-Type': 'application/json' } })
   } catch (e: any) {
     const msg = e?.message ?? 'Error'
     if (process.env.CALC_DEBUG) console.error('[calculate] error:', msg)
@@ -58,6 +70,8 @@ async function appendCalculationLog(req: NextRequest, inputs: Inputs, stats: { e
   const privateKeyRaw = process.env.GOOGLE_PRIVATE_KEY
   if (!sheetId || !clientEmail || !privateKeyRaw) return
 
+  // googleapis is large; load it only when a log row is actually written
+  const { google } = await import('googleapis')
   const privateKey = privateKeyRaw.replace(/\\n/g, '\n')
   const auth = new google.auth.JWT({
     email: clientEmail,
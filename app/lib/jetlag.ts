@@ -35,16 +35,16 @@ const MS_HOUR = 60 * MS_MINUTE
 const MS_DAY = 24 * MS_HOUR
 const EPSILON = 1e-6
 
-type Interval = [Date, Date]
+type EpochInterval = [number, number]
 
 type InterventionTuple = [
-  [boolean, Date],
-  [boolean, [Date, Date]],
-  [boolean, [Date, Date]],
-  [boolean, [Date, Date]]
+  [boolean, number],
+  [boolean, EpochInterval],
+  [boolean, EpochInterval],
+  [boolean, EpochInterval]
 ]
 
-type CBTEntry = [Date, InterventionTuple]
+type CBTEntry = [number, InterventionTuple]
 
 const PRESETS = {
   default: {
@@ -92,74 +92,65 @@ const subtractTimes = (timeMinutes1: number, timeMinutes2: number) => timeMinute
 
 const hoursFromMinutes = (minutes: number) => minutes / 60
 
-const intersectionHours = (interval1: Interval, interval2: Interval) => {
-  const [start1, end1] = interval1
-  const [start2, end2] = interval2
-  const latestStart = Math.max(start1.getTime(), start2.getTime())
-  const earliestEnd = Math.min(end1.getTime(), end2.getTime())
-  if (latestStart >= earliestEnd) return 0
-  return (earliestEnd - latestStart) / MS_HOUR
-}
+const isInsideInterval = (ts: number, interval: EpochInterval) => ts >= interval[0] && ts < interval[1]
 
-const isInsideInterval = (ts: Date, interval: Interval) => ts >= interval[0] && ts < interval[1]
+const overlapsInterval = (start: number, end: number, interval: EpochInterval) =>
+  Math.max(start, interval[0]) < Math.min(end, interval[1])
 
-const midnightForDatetime = (dt: Date) =>
-  new Date(Date.UTC(dt.getUTCFullYear(), dt.getUTCMonth(), dt.getUTCDate(), 0, 0, 0, 0))
+const combineEpochMinutes = (epochMs: number, minutesFromMidnight: number) =>
+  epochMs - mod(epochMs, MS_DAY) + minutesFromMidnight * MS_MINUTE
 
-const toIso = (dt: Date) => dt.toISOString().replace('.000Z', 'Z')
+const midnightForDatetime = (dt: Date) => new Date(combineEpochMinutes(dt.getTime(), 0))
 
-const combineDateMinutes = (date: Date, minutesFromMidnight: number) => {
-  const midnight = Date.UTC(date.getUTCFullYear(), date.getUTCMonth(), date.getUTCDate(), 0, 0, 0, 0)
-  return new Date(midnight + minutesFromMidnight * MS_MINUTE)
+const toIso = (epochMs: number) => {
+  const iso = new Date(epochMs).toISOString()
+  return iso.endsWith('.000Z') ? `${iso.slice(0, -5)}Z` : iso
 }
 
 const nextInterval = (
-  time: Date,
+  time: number,
   interval: [number, number],
-  filterWindow: Interval | null = null,
-): [Date | null, Date | null] => {
+  filterWindow: EpochInterval | null = null,
+): [number | null, number | null] => {
   const [startTimeMinutes, endTimeMinutes] = interval
-  const refDate = time
-  let startDt = combineDateMinutes(refDate, startTimeMinutes)
-  let endDt = combineDateMinutes(refDate, endTimeMinutes)
-
-  if (endDt <= startDt) {
-    endDt = addDays(endDt, 1)
-  }
-
-  if (startDt <= time) {
-    if (endDt > time) {
-      startDt = time
+  // Equal start and end means a full-day window
+  const durationMinutes = mod(endTimeMinutes - startTimeMinutes, 24 * 60) || 24 * 60
+  let start = combineEpochMinutes(time, startTimeMinutes)
+  let end = start + durationMinutes * MS_MINUTE
+
+  if (start <= time) {
+    if (end > time) {
+      start = time
     } else {
-      startDt = addDays(startDt, 1)
-      endDt = addDays(endDt, 1)
+      start += MS_DAY
+      end += MS_DAY
     }
   }
 
   if (filterWindow) {
     const [filterStart, filterEnd] = filterWindow
-    const overlapStart = new Date(Math.max(startDt.getTime(), filterStart.getTime()))
-    const overlapEnd = new Date(Math.min(endDt.getTime(), filterEnd.getTime()))
+    const overlapStart = Math.max(start, filterStart)
+    const overlapEnd = Math.min(end, filterEnd)
 
     if (overlapStart < overlapEnd) {
-      if (overlapStart <= startDt && overlapEnd >= endDt) {
+      if (overlapStart <= start && overlapEnd >= end) {
         return [null, null]
       }
-      if (overlapStart <= startDt) {
-        startDt = overlapEnd
-      } else if (overlapEnd >= endDt) {
-        endDt = overlapStart
+      if (overlapStart <= start) {
+        start = overlapEnd
+      } else if (overlapEnd >= end) {
+        end = overlapStart
       } else {
-        endDt = overlapStart
+        end = overlapStart
       }
     }
   }
 
-  if (startDt >= endDt) {
+  if (start >= end) {
     return [null, null]
   }
 
-  return [startDt, endDt]
+  return [start, end]
 }
 
 class CBTmin {
@@ -168,6 +159,10 @@ class CBTmin {
   presets: typeof PRESETS.default
   cbtmin: number
   phase_direction: string
+  melatoninOffsetMs: number
+  exerciseOffsetsMs: [number, number]
+  lightOffsetsMs: [number, number]
+  darkOffsetsMs: [number, number]
 
   constructor(originCbtmin: number, destCbtmin: number, shiftPreset = 'default') {
     this.originCbtmin = originCbtmin
@@ -176,6 +171,16 @@ class CBTmin {
     this.cbtmin = originCbtmin
     const diff = this.signedDifference()
     this.phase_direction = diff > 0 ? 'delay' : diff < 0 ? 'advance' : 'aligned'
+
+    const toMs = ([startHours, endHours]: [number, number]): [number, number] => [
+      startHours * MS_HOUR,
+      endHours * MS_HOUR,
+    ]
+    this.melatoninOffsetMs =
+      (this.optimalMelatoninTime() + (this.phase_direction === 'advance' ? 24 : 0)) * MS_HOUR
+    this.exerciseOffsetsMs = toMs(this.optimalExerciseWindow())
+    this.lightOffsetsMs = toMs(this.optimalLightWindow())
+    this.darkOffsetsMs = toMs(this.optimalDarkWindow())
   }
 
   signedDifference() {
@@ -235,9 +240,9 @@ class CBTmin {
   }
 
   nextCbtmin(
-    time: Date,
+    time: number,
     options: {
-      noInterventionWindow?: Interval | null
+      noInterventionWindow?: EpochInterval | null
       melatonin?: boolean
       exercise?: boolean
       light?: boolean
@@ -256,37 +261,45 @@ class CBTmin {
       skipShift = false,
     } = options
 
-    let nextCbtmin = combineDateMinutes(time, this.cbtmin)
+    let nextCbtmin = combineEpochMinutes(time, this.cbtmin)
     if (nextCbtmin <= time) {
-      nextCbtmin = addDays(nextCbtmin, 1)
+      nextCbtmin += MS_DAY
     }
-    const lastCbtmin = addDays(nextCbtmin, -1)
+    const lastCbtmin = nextCbtmin - MS_DAY
 
-    const optimalMelatonin = addHours(
-      lastCbtmin,
-      this.optimalMelatoninTime() + (this.phase_direction === 'advance' ? 24 : 0),
-    )
-    const exerciseWindow = this.optimalExerciseWindow()
-    const optimalExercise: [Date, Date] = [
-      addHours(lastCbtmin, exerciseWindow[0]),
-      addHours(lastCbtmin, exerciseWindow[1]),
+    const optimalMelatonin = lastCbtmin + this.melatoninOffsetMs
+    const optimalExercise: EpochInterval = [
+      lastCbtmin + this.exerciseOffsetsMs[0],
+      lastCbtmin + this.exerciseOffsetsMs[1],
+    ]
+    const optimalLight: EpochInterval = [
+      lastCbtmin + this.lightOffsetsMs[0],
+      lastCbtmin + this.lightOffsetsMs[1],
     ]
-    const lightWindow = this.optimalLightWindow()
-    const optimalLight: [Date, Date] = [
-      addHours(lastCbtmin, lightWindow[0]),
-      addHours(lastCbtmin, lightWindow[1]),
+    const optimalDark: EpochInterval = [
+      lastCbtmin + this.darkOffsetsMs[0],
+      lastCbtmin + this.darkOffsetsMs[1],
     ]
-    const darkWindow = this.optimalDarkWindow()
-    const optimalDark: [Date, Date] = [
-      addHours(lastCbtmin, darkWindow[0]),
-      addHours(lastCbtmin, darkWindow[1]),
+
+    const unshifted = (): CBTEntry => [
+      nextCbtmin,
+      [
+        [false, optimalMelatonin],
+        [false, optimalExercise],
+        [false, optimalLight],
+        [false, optimalDark],
+      ],
     ]
 
+    if (this.phase_direction === 'aligned' || skipShift) {
+      return unshifted()
+    }
+
     const window = noInterventionWindow
     const usedMelatonin = window && isInsideInterval(optimalMelatonin, window) ? false : melatonin
-    const usedExercise = window && intersectionHours(optimalExercise, window) > 0 ? false : exercise
-    const usedLight = window && intersectionHours(optimalLight, window) > 0 ? false : light
-    const usedDark = window && intersectionHours(optimalDark, window) > 0 ? false : dark
+    const usedExercise = window && overlapsInterval(optimalExercise[0], optimalExercise[1], window) ? false : exercise
+    const usedLight = window && overlapsInterval(optimalLight[0], optimalLight[1], window) ? false : light
+    const usedDark = window && overlapsInterval(optimalDark[0], optimalDark[1], window) ? false : dark
 
     let effectiveLight = usedLight
     let effectiveDark = usedDark
@@ -309,28 +322,17 @@ class CBTmin {
       cbtminDelta = Math.abs(this.signedDifference())
     }
 
-    if (
-      window &&
-      intersectionHours([addHours(nextCbtmin, -8), nextCbtmin], window) > 0
-    ) {
+    if (window && overlapsInterval(nextCbtmin - 8 * MS_HOUR, nextCbtmin, window)) {
       cbtminDelta = 0
     }
 
-    if (cbtminDelta === 0 || this.phase_direction === 'aligned' || skipShift) {
-      return [
-        nextCbtmin,
-        [
-          [false, optimalMelatonin],
-          [false, optimalExercise],
-          [false, optimalLight],
-          [false, optimalDark],
-        ],
-      ]
+    if (cbtminDelta === 0) {
+      return unshifted()
     }
 
     const directionSign = this.phase_direction === 'delay' ? 1 : -1
     this.cbtmin = sumTimeDelta(this.cbtmin, cbtminDelta * directionSign)
-    nextCbtmin = addHours(nextCbtmin, cbtminDelta * directionSign)
+    nextCbtmin += cbtminDelta * directionSign * MS_HOUR
 
     const interventions: InterventionTuple = [
       [effectiveMelatonin, optimalMelatonin],
@@ -343,6 +345,37 @@ class CBTmin {
   }
 }
 
+type TimedEvent = { ts: number; seq: number; event: JetLagEvent }
+
+// Indexed like InterventionTuple
+const INTERVENTION_KINDS = [
+  ['melatonin', 'is_melatonin'],
+  ['exercise', 'is_exercise'],
+  ['light', 'is_light'],
+  ['dark', 'is_dark'],
+] as const
+
+const mergeSortedRuns = (runs: TimedEvent[][]) => {
+  const heads = runs.map(() => 0)
+  const total = runs.reduce((count, run) => count + run.length, 0)
+  const merged: JetLagEvent[] = []
+  while (merged.length < total) {
+    let bestRun = -1
+    let best: TimedEvent | undefined
+    for (let r = 0; r < runs.length; r++) {
+      const head = runs[r]![heads[r]!]
+      if (head && (!best || head.ts < best.ts || (head.ts === best.ts && head.seq < best.seq))) {
+        bestRun = r
+        best = head
+      }
+    }
+    if (!best) break
+    merged.push(best.event)
+    heads[bestRun] = heads[bestRun]! + 1
+  }
+  return merged
+}
+
 export const createJetLagTimetable = (inputs: JetLagInputs): JetLagEvent[] => {
   const originSleepStart = parseHHMM(inputs.originSleepStart)
   const originSleepEnd = parseHHMM(inputs.originSleepEnd)
@@ -407,9 +440,11 @@ export const createJetLagTimetable = (inputs: JetLagInputs): JetLagEvent[] => {
   const noInterventionWindow =
     mode === 'travel_start' || mode === 'precondition_with_travel'
       ? null
-      : ([travelStartUtc, travelEndUtc] as Interval)
+      : ([travelStartUtc.getTime(), travelEndUtc.getTime()] as EpochInterval)
+  const startOfShiftMs = startOfShift.getTime()
+  const travelStartMs = travelStartUtc.getTime()
 
-  const [firstCbtmin] = cbt.nextCbtmin(midnightStartOfCalculations, {
+  const [firstCbtmin] = cbt.nextCbtmin(midnightStartOfCalculations.getTime(), {
     noInterventionWindow,
     melatonin: inputs.useMelatonin,
     exercise: inputs.useExercise,
@@ -438,8 +473,8 @@ export const createJetLagTimetable = (inputs: JetLagInputs): JetLagEvent[] => {
 
     const isPrecondition =
       (mode === 'travel_start' || mode === 'precondition_with_travel') &&
-      timeCursor > startOfShift &&
-      timeCursor < travelStartUtc
+      timeCursor > startOfShiftMs &&
+      timeCursor < travelStartMs
 
     const [nextCbt, interventions] = cbt.nextCbtmin(timeCursor, {
       noInterventionWindow,
@@ -448,134 +483,39 @@ export const createJetLagTimetable = (inputs: JetLagInputs): JetLagEvent[] => {
       light: inputs.useLightDark,
       dark: inputs.useLightDark,
       precondition: isPrecondition,
-      skipShift: timeCursor < startOfShift,
+      skipShift: timeCursor < startOfShiftMs,
     })
 
     cbtEntries.push([nextCbt, interventions])
     timeCursor = nextCbt
   }
 
-  const midnightEndOfCalculations = midnightForDatetime(addDays(cbtEntries[cbtEntries.length - 1][0], 1))
-
-  const interventionEvents: JetLagEvent[] = []
+  const midnightEndOfCalculations = combineEpochMinutes(cbtEntries[cbtEntries.length - 1][0] + MS_DAY, 0)
 
   const signedDiff = cbt.signedDifference()
   const phaseDirection = cbt.phase_direction
 
-  for (const entry of cbtEntries) {
-    const [cbtTime, interventions] = entry
-    interventionEvents.push({
-      event: 'cbtmin',
-      start: toIso(cbtTime),
-      end: null,
-      is_cbtmin: true,
-      is_melatonin: false,
-      is_light: false,
-      is_dark: false,
-      is_exercise: false,
-      is_sleep: false,
-      is_travel: false,
-      day_index: null,
-      phase_direction: phaseDirection,
-      signed_initial_diff_hours: signedDiff,
-    })
-
-    if (interventions[0][0]) {
-      interventionEvents.push({
-        event: 'melatonin',
-        start: toIso(interventions[0][1]),
-        end: null,
-        is_cbtmin: false,
-        is_melatonin: true,
-        is_light: false,
-        is_dark: false,
-        is_exercise: false,
-        is_sleep: false,
-        is_travel: false,
-        day_index: null,
-        phase_direction: phaseDirection,
-        signed_initial_diff_hours: signedDiff,
-      })
-    }
-
-    if (interventions[1][0]) {
-      interventionEvents.push({
-        event: 'exercise',
-        start: toIso(interventions[1][1][0]),
-        end: toIso(interventions[1][1][1]),
-        is_cbtmin: false,
-        is_melatonin: false,
-        is_light: false,
-        is_dark: false,
-        is_exercise: true,
-        is_sleep: false,
-        is_travel: false,
-        day_index: null,
-        phase_direction: phaseDirection,
-        signed_initial_diff_hours: signedDiff,
-      })
-    }
-
-    if (interventions[2][0]) {
-      interventionEvents.push({
-        event: 'light',
-        start: toIso(interventions[2][1][0]),
-        end: toIso(interventions[2][1][1]),
-        is_cbtmin: false,
-        is_melatonin: false,
-        is_light: true,
-        is_dark: false,
-        is_exercise: false,
-        is_sleep: false,
-        is_travel: false,
-        day_index: null,
-        phase_direction: phaseDirection,
-        signed_initial_diff_hours: signedDiff,
-      })
-    }
-
-    if (interventions[3][0]) {
-      interventionEvents.push({
-        event: 'dark',
-        start: toIso(interventions[3][1][0]),
-        end: toIso(interventions[3][1][1]),
-        is_cbtmin: false,
-        is_melatonin: false,
-        is_light: false,
-        is_dark: true,
-        is_exercise: false,
-        is_sleep: false,
-        is_travel: false,
-        day_index: null,
-        phase_direction: phaseDirection,
-        signed_initial_diff_hours: signedDiff,
-      })
-    }
-  }
-
-  const sleepWindows: Interval[] = []
-  let sleepTime = midnightStartOfCalculations
+  const travelWindow: EpochInterval = [travelStartMs, travelEndUtc.getTime()]
+  const sleepWindows: EpochInterval[] = []
+  let sleepTime = midnightStartOfCalculations.getTime()
   let sleepDest = false
 
   while (sleepTime < midnightEndOfCalculations) {
     if (!sleepDest) {
-      const [s, e] = nextInterval(sleepTime, [originSleepStartUtc, originSleepEndUtc], [
-        travelStartUtc,
-        travelEndUtc,
-      ])
-      if (!s || !e) {
-        sleepTime = addDays(sleepTime, 1)
+      const [s, e] = nextInterval(sleepTime, [originSleepStartUtc, originSleepEndUtc], travelWindow)
+      if (s === null || e === null) {
+        sleepTime += MS_DAY
         continue
       }
-      if (e > travelStartUtc || sleepDest) {
+      if (e > travelStartMs || sleepDest) {
         const [sDest, eDest] = nextInterval(
           sleepTime,
           [destinationSleepStartUtc, destinationSleepEndUtc],
-          [travelStartUtc, travelEndUtc],
+          travelWindow,
         )
         sleepDest = true
-        if (!sDest || !eDest) {
-          sleepTime = addDays(sleepTime, 1)
+        if (sDest === null || eDest === null) {
+          sleepTime += MS_DAY
           continue
         }
         sleepWindows.push([sDest, eDest])
@@ -590,54 +530,138 @@ export const createJetLagTimetable = (inputs: JetLagInputs): JetLagEvent[] => {
     const [s, e] = nextInterval(
       sleepTime,
       [destinationSleepStartUtc, destinationSleepEndUtc],
-      [travelStartUtc, travelEndUtc],
+      travelWindow,
     )
-    if (!s || !e) {
-      sleepTime = addDays(sleepTime, 1)
+    if (s === null || e === null) {
+      sleepTime += MS_DAY
       continue
     }
     sleepWindows.push([s, e])
     sleepTime = e
   }
 
-  const events: JetLagEvent[] = []
-
-  for (const [start, end] of sleepWindows) {
-    events.push({
-      event: 'sleep',
-      start: toIso(start),
-      end: toIso(end),
-      is_cbtmin: false,
-      is_melatonin: false,
-      is_light: false,
-      is_dark: false,
-      is_exercise: false,
-      is_sleep: true,
-      is_travel: false,
-      day_index: null,
-      phase_direction: phaseDirection,
-      signed_initial_diff_hours: signedDiff,
-    })
+  // Each run is chronological; `seq` orders events that start at the same
+  // instant by the order they were emitted.
+  let seq = 0
+  const timed = (ts: number, event: JetLagEvent): TimedEvent => ({ ts, seq: seq++, event })
+  const isoByMs = new Map<number, string>()
+  const iso = (epochMs: number) => {
+    let formatted = isoByMs.get(epochMs)
+    if (formatted === undefined) {
+      formatted = toIso(epochMs)
+      isoByMs.set(epochMs, formatted)
+    }
+    return formatted
   }
-
-  events.push({
-    event: 'travel',
-    start: toIso(travelStartUtc),
-    end: toIso(travelEndUtc),
+  const baseEvent: JetLagEvent = {
+    event: '',
+    start: '',
+    end: null,
     is_cbtmin: false,
     is_melatonin: false,
     is_light: false,
     is_dark: false,
     is_exercise: false,
     is_sleep: false,
-    is_travel: true,
+    is_travel: false,
     day_index: null,
     phase_direction: phaseDirection,
     signed_initial_diff_hours: signedDiff,
-  })
+  }
+  const sleepRun: TimedEvent[] = []
+  const travelRun: TimedEvent[] = []
+  const cbtminRun: TimedEvent[] = []
+  const interventionRuns: TimedEvent[][] = INTERVENTION_KINDS.map(() => [])
 
-  events.push(...interventionEvents)
+  for (const [start, end] of sleepWindows) {
+    sleepRun.push(timed(start, {
+      ...baseEvent,
+      event: 'sleep',
+      start: iso(start),
+      end: iso(end),
+      is_sleep: true,
+    }))
+  }
 
-  events.sort((a, b) => a.start.localeCompare(b.start))
-  return events
+  travelRun.push(timed(travelStartUtc.getTime(), {
+    ...baseEvent,
+    event: 'travel',
+    start: iso(travelStartUtc.getTime()),
+    end: iso(travelEndUtc.getTime()),
+    is_travel: true,
+  }))
+
+  for (const entry of cbtEntries) {
+    const [cbtTime, interventions] = entry
+    cbtminRun.push(timed(cbtTime, {
+      ...baseEvent,
+      event: 'cbtmin',
+      start: iso(cbtTime),
+      is_cbtmin: true,
+    }))
+
+    for (let k = 0; k < INTERVENTION_KINDS.length; k++) {
+      const [used, when] = interventions[k]!
+      if (!used) continue
+      const [event, flag] = INTERVENTION_KINDS[k]!
+      const [start, end]: [number, number | null] = typeof when === 'number' ? [when, null] : when
+      interventionRuns[k]!.push(timed(start, {
+        ...baseEvent,
+        event,
+        start: iso(start),
+        end: end === null ? null : iso(end),
+        [flag]: true,
+      }))
+    }
+  }
+
+  return mergeSortedRuns([sleepRun, travelRun, cbtminRun, ...interventionRuns])
 }
+
+// Must list every JetLagInputs field, or cached timetables go stale
+const INPUT_KEY_SET = {
+  originOffset: true,
+  destOffset: true,
+  originSleepStart: true,
+  originSleepEnd: true,
+  destSleepStart: true,
+  destSleepEnd: true,
+  travelStart: true,
+  travelEnd: true,
+  useMelatonin: true,
+  useLightDark: true,
+  useExercise: true,
+  preDays: true,
+  adjustmentStart: true,
+} satisfies Record<keyof JetLagInputs, true>
+
+const INPUT_KEYS = Object.keys(INPUT_KEY_SET) as (keyof JetLagInputs)[]
+
+// JSON-encoding each field keeps values of different types apart
+// (false vs 'false', null vs a missing field).
+export const timetableInputsKey = (inputs: JetLagInputs) =>
+  INPUT_KEYS.map(k => JSON.stringify(inputs[k]) ?? 'undefined').join('|')
+
+// Map iteration order is the recency order
+export const lruGet = <V>(cache: Map<string, V>, key: string, limit: number, compute: () => V): V => {
+  const hit = cache.get(key)
+  if (hit !== undefined) {
+    cache.delete(key)
+    cache.set(key, hit)
+    return hit
+  }
+  const value = compute()
+  cache.set(key, value)
+  if (cache.size > limit) {
+    const oldest = cache.keys().next().value
+    if (oldest !== undefined) cache.delete(oldest)
+  }
+  return value
+}
+
+const TIMETABLE_CACHE_SIZE = 64
+const timetableCache = new Map<string, JetLagEvent[]>()
+
+// Hits return the same array, which callers must treat as read-only.
+export const createJetLagTimetableCached = (inputs: JetLagInputs): JetLagEvent[] =>
+  lruGet(timetableCache, timetableInputsKey(inputs), TIMETABLE_CACHE_SIZE, () => createJetLagTimetable(inputs))
@@ -44,17 +44,28 @@ export function getTimeZoneOffsetHours(timeZone: string, referenceDate?: Date |
   }
 }
 
+const formatterCache = new Map<string, Intl.DateTimeFormat>()
+
+function getOffsetFormatter(timeZone: string): Intl.DateTimeFormat {
+  let dtf = formatterCache.get(timeZone)
+  if (!dtf) {
+    dtf = new Intl.DateTimeFormat('en-US', {
+      timeZone,
+      hour12: false,
+      year: 'numeric',
+      month: '2-digit',
+      day: '2-digit',
+      hour: '2-digit',
+      minute: '2-digit',
+      second: '2-digit',
+    })
+    formatterCache.set(timeZone, dtf)
+  }
+  return dtf
+}
+
 function getTimeZoneOffsetMinutes(timeZone: string, date: Date): number {
-  const dtf = new Intl.DateTimeFormat('en-US', {
-    timeZone,
-    hour12: false,
-    year: 'numeric',
-    month: '2-digit',
-    day: '2-digit',
-    hour: '2-digit',
-    minute: '2-digit',
-    second: '2-digit',
-  })
+  const dtf = getOffsetFormatter(timeZone)
   const parts = dtf.formatToParts(date)
   const map = new Map<string, string>()
   for (const part of parts) {
@@ -2,7 +2,7 @@
 import { useEffect, useMemo, useRef, useState } from 'react'
 import styles from './page.module.css'
 import ScheduleSvgGrid from './ScheduleSvgGrid'
-import { createJetLagTimetable } from './lib/jetlag'
+import { createJetLagTimetableCached } from './lib/jetlag'
 import TimezoneSelect from './components/TimezoneSelect'
 import { getTimeZoneNames, getTimeZoneOffsetHours } from './lib/timezones'
 import {
@@ -226,6 +226,8 @@ export default function Page() {
   const destReferenceDate = useMemo(() => pickReferenceDate(travelEnd), [travelEnd])
   const [timezoneNames, setTimezoneNames] = useState<string[]>(() => getTimeZoneNames())
   const timezoneNameSet = useMemo(() => new Set(timezoneNames), [timezoneNames])
+  // Rasterize once per timetable; the grid and the report payload share it
+  const scheduleDays = useMemo(() => (events?.length ? groupEventsByUTCDate(events) : []), [events])
 
   useEffect(() => {
     // For beta: show on every reload for now
@@ -357,7 +359,7 @@ export default function Page() {
     setLoading(true)
     setError(null)
     try {
-      const receivedEvents = createJetLagTimetable({
+      const receivedEvents = createJetLagTimetableCached({
         originOffset,
         destOffset,
         originSleepStart,
@@ -660,7 +662,7 @@ export default function Page() {
                   <span className={styles.legendBox + ' ' + styles.cbtmin}>CBTmin</span>
                   <span className={styles.legendBox + ' ' + styles.travel}>Travel</span>
                 </div>
-                <ScheduleSvgGrid days={groupEventsByUTCDate(events)} originOffset={legendOriginOffset} destOffset={legendDestOffset} />
+                <ScheduleSvgGrid days={scheduleDays} originOffset={legendOriginOffset} destOffset={legendDestOffset} />
               </Box>
             )}
 
@@ -928,11 +930,7 @@ export default function Page() {
                 }
                 // attach full rasterized slots
                 try {
-                  let slotsPayload: any[] = []
-                  if (Array.isArray(events) && events.length) {
-                    const days = groupEventsByUTCDate(events)
-                    slotsPayload = ([] as any[]).concat(...days.map(d => d.slots))
-                  }
+                  const slotsPayload = ([] as any[]).concat(...scheduleDays.map(d => d.slots))
                   ;(payload as any).slots = slotsPayload
                 } catch {}
                 const res = await fetch('/api/report', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(payload) })
@@ -1061,48 +1059,120 @@ export default function Page() {
   )
 }
 
-function groupEventsByUTCDate(events: any[]) {
-  // Build 30-minute slots for each UTC day spanned by events
-  const parseUTC = (s: string | null) => {
-    if (!s) return null
-    const str = String(s)
-    return /Z$|[+-]\d{2}:\d{2}$/.test(str) ? new Date(str) : new Date(str + 'Z')
+const SLOT_MS = 30*60*1000
+const DAY_MS = 24*3600*1000
+const HAS_OFFSET = /Z$|[+-]\d{2}:\d{2}$/
+// Bit for each flag in the per-slot masks built by groupEventsByUTCDate
+const FLAG_BITS = {
+  is_sleep: 1,
+  is_light: 2,
+  is_dark: 4,
+  is_travel: 8,
+  is_exercise: 16,
+  is_melatonin: 32,
+  is_cbtmin: 64,
+} as const
+const FLAG_KEYS = Object.keys(FLAG_BITS) as (keyof typeof FLAG_BITS)[]
+// Slot boundaries repeat the same 48 times of day, so ISO strings are a date
+// prefix plus a precomputed suffix; only the date is formatted per day.
+const SLOT_TIMES = Array.from({ length: 48 }, (_, i) =>
+  `T${String(Math.floor(i/2)).padStart(2, '0')}:${i % 2 ? '30' : '00'}:00.000Z`)
+
+const UTC_ISO = /^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{3}))?Z$/
+const DAYS_IN_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+function daysInMonth(year: number, month: number) {
+  const leap = year % 4 === 0 && (year % 100 !== 0 || year % 400 === 0)
+  return month === 2 && leap ? 29 : DAYS_IN_MONTH[month - 1]!
+}
+
+function parseUTC(s: string | null) {
+  if (!s) return null
+  const str = String(s)
+  // Timetable events always use the fixed UTC form, which Date.UTC builds
+  // directly; anything else, including out-of-range fields, goes through the
+  // generic parser.
+  const m = UTC_ISO.exec(str)
+  if (m) {
+    const year = Number(m[1])
+    const month = Number(m[2])
+    const day = Number(m[3])
+    const hour = Number(m[4])
+    const minute = Number(m[5])
+    const second = Number(m[6])
+    if (year >= 100 && month >= 1 && month <= 12 && day >= 1 && day <= daysInMonth(year, month) &&
+        hour < 24 && minute < 60 && second < 60) {
+      return Date.UTC(year, month - 1, day, hour, minute, second, m[7] ? Number(m[7]) : 0)
+    }
   }
+  return (HAS_OFFSET.test(str) ? new Date(str) : new Date(str + 'Z')).getTime()
+}
+
+function groupEventsByUTCDate(events: any[]) {
+  // Build 30-minute slots for each UTC day spanned by events.
   if (!events.length) return [] as any[]
-  const starts = events.map(e => parseUTC(e.start)).filter(Boolean) as Date[]
-  const ends = events.map(e => parseUTC(e.end)).filter(Boolean) as Date[]
-  const minStart = new Date(Math.min(...starts.map(d => d.getTime())))
-  const maxEnd = ends.length ? new Date(Math.max(...ends.map(d => d.getTime()))) : new Date(Math.max(...starts.map(d => d.getTime())))
-  const startDay = new Date(Date.UTC(minStart.getUTCFullYear(), minStart.getUTCMonth(), minStart.getUTCDate()))
-  const endDay = new Date(Date.UTC(maxEnd.getUTCFullYear(), maxEnd.getUTCMonth(), maxEnd.getUTCDate()))
+  // Parse every timestamp exactly once; everything below works on these numbers
+  const parsed = events.map(e => ({ e, es: parseUTC(e.start), ee: parseUTC(e.end) }))
+  const starts = parsed.map(p => p.es).filter(t => t != null) as number[]
+  const ends = parsed.map(p => p.ee).filter(t => t != null) as number[]
+  const minStart = Math.min(...starts)
+  const maxEnd = ends.length ? Math.max(...ends) : Math.max(...starts)
+  const startDay = minStart - (((minStart % DAY_MS) + DAY_MS) % DAY_MS)
+  const endDay = maxEnd - (((maxEnd % DAY_MS) + DAY_MS) % DAY_MS)
+  // Unparseable timestamps give no day range; render an empty grid
+  if (!Number.isFinite(startDay) || !Number.isFinite(endDay)) return [] as any[]
   // Drop the last day row as requested
-  const lastRowDay = new Date(Math.max(startDay.getTime(), endDay.getTime() - 24*3600*1000))
+  const lastRowDay = Math.max(startDay, endDay - DAY_MS)
+  // Every slot carries one bit per flag. Each event computes the slot range it
+  // touches and ORs its bits in, so no slot ever scans the event list.
+  const numSlots = ((lastRowDay - startDay) / DAY_MS + 1) * 48
+  const slotMasks = new Uint8Array(numSlots)
+  for (const { e, es, ee } of parsed) {
+    if (es == null) continue
+    const mask = FLAG_KEYS.reduce((m, k) => (e[k] ? m | FLAG_BITS[k] : m), 0)
+    if (!mask) continue
+    const offset = es - startDay
+    let from: number
+    let to: number
+    if (ee == null) {
+      // A point marks its own slot; one on a day boundary also marks the last
+      // slot of the previous day.
+      from = Math.floor(offset / SLOT_MS)
+      to = from + 1
+      if (from % 48 === 0 && offset % SLOT_MS === 0) from -= 1
+    } else {
+      from = Math.floor(offset / SLOT_MS)
+      to = Math.ceil((ee - startDay) / SLOT_MS)
+    }
+    for (let k = Math.max(0, from); k < Math.min(numSlots, to); k++) {
+      slotMasks[k] = slotMasks[k]! | mask
+    }
+  }
   const days: { date: string, slots: any[] }[] = []
-  for (let d = new Date(startDay); d <= lastRowDay; d = new Date(d.getTime() + 24*3600*1000)) {
-    const dateStr = d.toISOString().slice(0,10)
+  let slotIndex = 0
+  let dateStr = new Date(startDay).toISOString().slice(0,10)
+  for (let d = startDay; d <= lastRowDay; d += DAY_MS) {
+    const nextDateStr = new Date(d + DAY_MS).toISOString().slice(0,10)
     const slots = [] as any[]
     for (let i = 0; i < 48; i++) {
-      const slotStart = new Date(d.getTime() + i*30*60*1000)
-      const slotEnd = new Date(d.getTime() + (i+1)*30*60*1000)
-      const flags = { is_sleep:false, is_light:false, is_dark:false, is_travel:false, is_exercise:false, is_melatonin:false, is_cbtmin:false }
-      for (const e of events) {
-        const es = parseUTC(e.start)
-        const ee = parseUTC(e.end)
-        let occurs = false
-        if (ee == null && es) {
-          occurs = (es >= slotStart && es < slotEnd) || (i === 47 && es.getTime() === slotEnd.getTime())
-        } else if (es && ee) {
-          occurs = es < slotEnd && ee > slotStart
-        }
-        if (occurs) {
-          for (const k of Object.keys(flags) as (keyof typeof flags)[]) {
-            if (e[k]) flags[k] = true
-          }
-        }
-      }
-      slots.push({ ...flags, start: slotStart.toISOString(), end: slotEnd.toISOString() })
+      const startIso = dateStr + SLOT_TIMES[i]
+      const endIso = i < 47 ? dateStr + SLOT_TIMES[i+1] : nextDateStr + SLOT_TIMES[0]
+      const m = slotMasks[slotIndex++]!
+      // Fixed key order gives every slot the same shape
+      slots.push({
+        is_sleep: (m & FLAG_BITS.is_sleep) !== 0,
+        is_light: (m & FLAG_BITS.is_light) !== 0,
+        is_dark: (m & FLAG_BITS.is_dark) !== 0,
+        is_travel: (m & FLAG_BITS.is_travel) !== 0,
+        is_exercise: (m & FLAG_BITS.is_exercise) !== 0,
+        is_melatonin: (m & FLAG_BITS.is_melatonin) !== 0,
+        is_cbtmin: (m & FLAG_BITS.is_cbtmin) !== 0,
+        start: startIso,
+        end: endIso,
+      })
     }
     days.push({ date: dateStr, slots })
+    dateStr = nextDateStr
   }
   return days
 }